@@ -1,6 +1,9 @@
 import os
 import re
 from sys import stderr
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from binascii import b2a_hex
 from readers import ByteReader
 from hexdump import strescape, toout, ashex
@@ -8,6 +11,15 @@ from TableDefinition import TableDefinition
 from Datafile import Datafile
 from Record import Record
 
+# bytes which `dump_db_definition` prints as a quoted string: cr, lf, tab, ascii and cp1251 letters.
+PRINTABLE = b"\x0d\x0a\x09" + bytes(range(0x20, 0x7F)) + bytes(range(0xC0, 0x100))
+
+# `recdump --stats` only uses worker processes for files with at least this many records.
+PARALLEL_MINRECS = 0x10000
+
+# subfield or special field markers, searched for by `recdump --find1d`
+FIND1D = re.compile(b"[\x1b\x1d]")
+
 
 class Database:
     """represent the entire database, consisting of Stru, Index and Bank files"""
@@ -15,6 +27,12 @@ class Database:
     def __init__(self, dbdir):
         self.dbdir = dbdir
 
+        # maps lowercased filenames to the actual names found in `dbdir`
+        try:
+            self.dirmap = {fn.name.lower(): fn.name for fn in os.scandir(self.dbdir)}
+        except IOError:
+            self.dirmap = dict()
+
         # Stru+Index+Bank for the components for most databases
         self.stru = self.getfile("Stru")
         self.index = self.getfile("Index")
@@ -24,8 +42,12 @@ class Database:
         # contains an index of all known databases.
         self.sys = self.getfile("Sys")
 
+        # the decoded database definition, and its `BaseNNN` entries, see `getdbdef`
+        self.dbdef = None
+        self.basedefs = None
+
     def nrofrecords(self):
-        return len(self.bank.tadidx)
+        return self.bank.nrofrecords()
 
     def getfile(self, name):
         """
@@ -39,7 +61,13 @@ class Database:
             datname = self.getname(name, "dat")
             tadname = self.getname(name, "tad")
             if datname and tadname:
-                return Datafile(name, open(datname, "rb"), open(tadname, "rb"))
+                # the .dat is memory mapped by `Datafile`, the large buffer is only used when
+                # that fails. the .tad is read completely by `Datafile.readtad`.
+                dbfile = Datafile(name, open(datname, "rb", buffering=0x10000), open(tadname, "rb"))
+                # enables more kernel readahead for reads on the files: the .tad, and the .dat
+                # when it could not be mapped. the mapping itself is advised by `Datafile.sequential`.
+                dbfile.fadvise("POSIX_FADV_SEQUENTIAL")
+                return dbfile
         except IOError:
             return
 
@@ -49,9 +77,9 @@ class Database:
         Returns None when no matching file was not found.
         """
         basename = "Cro%s.%s" % (name, ext)
-        for fn in os.scandir(self.dbdir):
-            if basename.lower() == fn.name.lower():
-                return os.path.join(self.dbdir, fn.name)
+        fn = self.dirmap.get(basename.lower())
+        if fn:
+            return os.path.join(self.dbdir, fn)
 
     def dump(self, args):
         """
@@ -81,28 +109,63 @@ class Database:
         """
         rd = ByteReader(data)
 
-        d = dict()
+        # first collect all keys, with either their inline value, or the
+        # recid of the CroStru record containing the value.
+        items = []
+        keys = set()
         while not rd.eof():
             keyname = rd.readname()
-            if keyname in d:
+            if keyname in keys:
                 print("WARN: duplicate key: %s" % keyname)
+            keys.add(keyname)
 
             index_or_length = rd.readdword()
             if index_or_length >> 31:
-                d[keyname] = rd.readbytes(index_or_length & 0x7FFFFFFF)
+                items.append((keyname, None, rd.readbytes(index_or_length & 0x7FFFFFFF)))
             else:
-                refdata = self.stru.readrec(index_or_length)
+                items.append((keyname, index_or_length, None))
+
+        # then read all referenced records in one go.
+        refs = self.stru.readrecs(idx for _, idx, _ in items if idx is not None)
+
+        d = dict()
+        for keyname, idx, value in items:
+            if idx is not None:
+                refdata = refs[idx]
                 if refdata[:1] != b"\x04":
                     print("WARN: expected refdata to start with 0x04")
-                d[keyname] = refdata[1:]
+                value = refdata[1:]
+            d[keyname] = value
         return d
 
+    def getdbdef(self):
+        """
+        Returns the decoded database definition from CroStru recid #1.
+        This is decoded only once, and cached for later calls.
+        """
+        if self.dbdef is None:
+            dbinfo = self.stru.readrec(1)
+            if dbinfo[:1] != b"\x03":
+                print("WARN: expected dbinfo to start with 0x03")
+            self.dbdef = self.decode_db_definition(dbinfo[1:])
+        return self.dbdef
+
+    def getbasedefs(self):
+        """
+        Returns a list of (key, value, number) for all `BaseNNN` entries
+        in the database definition.
+        """
+        if self.basedefs is None:
+            self.basedefs = [ (k, v, k[4:]) for k, v in self.getdbdef().items() if k.startswith("Base") and k[4:].isnumeric() ]
+        return self.basedefs
+
     def dump_db_definition(self, args, dbdict):
         """
         decode the 'bank' / database definition
         """
         for k, v in dbdict.items():
-            if re.search(b"[^\x0d\x0a\x09\x20-\x7e\xc0-\xff]", v):
+            # deleting all printable bytes leaves only the non-printable ones.
+            if v.translate(None, PRINTABLE):
                 print("%-20s - %s" % (k, toout(args, v)))
             else:
                 print('%-20s - "%s"' % (k, strescape(v)))
@@ -115,33 +178,21 @@ class Database:
         other table-id's found in CroStru:
             #4  -> large values referenced from tableid#3
         """
-        dbinfo = self.stru.readrec(1)
-        if dbinfo[:1] != b"\x03":
-            print("WARN: expected dbinfo to start with 0x03")
-        dbdef = self.decode_db_definition(dbinfo[1:])
+        dbdef = self.getdbdef()
         self.dump_db_definition(args, dbdef)
 
-        for k, v in dbdef.items():
-            if k.startswith("Base") and k[4:].isnumeric():
-                print("== %s ==" % k)
-                tbdef = TableDefinition(v)
-                tbdef.dump(args)
+        for k, v, num in self.getbasedefs():
+            print("== %s ==" % k)
+            tbdef = TableDefinition(v)
+            tbdef.dump(args)
 
     def enumerate_tables(self, files=False):
         """
         yields a TableDefinition object for all `BaseNNN` entries found in CroStru
         """
-        dbinfo = self.stru.readrec(1)
-        if dbinfo[:1] != b"\x03":
-            print("WARN: expected dbinfo to start with 0x03")
-        dbdef = self.decode_db_definition(dbinfo[1:])
-
-        for k, v in dbdef.items():
-            if k.startswith("Base") and k[4:].isnumeric():
-                if files and k[4:] == "000":
-                    yield TableDefinition(v)
-                if not files and k[4:] != "000":
-                    yield TableDefinition(v)
+        for k, v, num in self.getbasedefs():
+            if (num == "000") == bool(files):
+                yield TableDefinition(v)
 
     def enumerate_records(self, table):
         """
@@ -153,23 +204,28 @@ class Database:
             for rec in db.enumerate_records(tab):
                 print(sqlformatter(tab, rec))
         """
-        for i in range(self.nrofrecords()):
-            data = self.bank.readrec(i + 1)
-            if data and data[0] == table.tableid:
-                try:
-                    yield Record(i + 1, table.fields, data[1:])
-                except Exception as e:
-                    print("Record broken: " + str(i + 1) + "  -----> " + ashex(data), file=stderr)
+        for recnum, data in self.enumerate_table_data(table.tableid):
+            try:
+                yield Record(recnum, table.fields, data[1:])
+            except Exception as e:
+                print("Record broken: " + str(recnum) + "  -----> " + ashex(data), file=stderr)
 
     def enumerate_files(self, table):
         """
         Yield all file contents found in CroBank for `table`.
         This is most likely the table with id 0.
         """
-        for i in range(self.nrofrecords()):
-            data = self.bank.readrec(i + 1)
-            if data and data[0] == table.tableid:
-                yield i + 1, data[1:]
+        for recnum, data in self.enumerate_table_data(table.tableid):
+            yield recnum, data[1:]
+
+    def enumerate_table_data(self, tableid):
+        """
+        Yields (recnum, data) for all records in CroBank with `tableid`.
+        Note that `data` still starts with the tableid byte.
+        """
+        for recnum, data in self.bank.enumrecords():
+            if data and data[0] == tableid:
+                yield recnum, data
 
     def recdump(self, args):
         """
@@ -192,50 +248,191 @@ class Database:
         if args.skipencrypted and dbfile.encoding == 3:
             print("Skipping encrypted CroBank")
             return
-        nerr = 0
-        nr_recnone = 0
-        nr_recempty = 0
-        tabidxref = [0] * 256
-        bytexref = [0] * 256
-        for i in range(1, args.maxrecs + 1):
-            try:
-                data = dbfile.readrec(i)
-                if args.find1d:
-                    if data and (data.find(b"\x1d") > 0 or data.find(b"\x1b") > 0):
-                        print("%d -> %s" % (i, b2a_hex(data)))
-                        break
+        if (args.stats or args.tabstats) and not args.find1d:
+            self.recstats(args, dbfile)
+            if args.dropcache:
+                dbfile.dropcache()
+            return
 
-                elif not args.stats:
-                    if data is None:
+        with dbfile.sequential():
+            nerr = 0
+            for i in dbfile.prefetching(range(1, min(args.maxrecs, dbfile.nrofrecords()) + 1)):
+                try:
+                    data = dbfile.readrec(i)
+                    if args.find1d:
+                        # any marker after the first byte, also when the record starts with one.
+                        if data and FIND1D.search(data, 1):
+                            print("%d -> %s" % (i, b2a_hex(data)))
+                            break
+
+                    elif data is None:
                         print("%5d: <deleted>" % i)
                     else:
                         print("%5d: %s" % (i, toout(args, data)))
+                    nerr = 0
+                except IndexError:
+                    break
+                except Exception as e:
+                    print("%5d: <%s>" % (i, e))
+                    if args.debug:
+                        raise
+                    nerr += 1
+                    if nerr > 5:
+                        break
+
+        if args.dropcache:
+            dbfile.dropcache()
+
+    def recstats(self, args, dbfile):
+        """
+        Output the `recdump --stats` table-id and byte statistics for `dbfile`.
+        With `--tabstats` only the table-id stats are output, which needs just
+        the start of each record.
+
+        Large files are split in ranges of records, which are counted in
+        parallel by `args.jobs` worker processes.
+        """
+        nrecs = min(args.maxrecs, dbfile.nrofrecords())
+        jobs = args.jobs or os.cpu_count() or 1
+        tabonly = args.tabstats and not args.stats
+
+        if jobs > 1 and nrecs >= PARALLEL_MINRECS:
+            step = (nrecs + jobs - 1) // jobs
+            ranges = [ (first, min(first + step - 1, nrecs)) for first in range(1, nrecs + 1, step) ]
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                shards = [ pool.submit(shard_recstats, self.dbdir, dbfile.name, first, last, args.debug, tabonly)
+                           for first, last in ranges ]
+                merged = merge_recstats(ranges, (_.result() for _ in shards))
+                # shards after the one where the scan gave up are not needed.
+                for _ in shards:
+                    _.cancel()
+        elif tabonly:
+            merged = merge_recstats([(1, nrecs)], [collect_recstats(dbfile, 1, nrecs, args.debug, tabonly)])
+        else:
+            with dbfile.sequential():
+                merged = merge_recstats([(1, nrecs)], [collect_recstats(dbfile, 1, nrecs, args.debug, tabonly)])
+
+        nr_recnone, nr_recempty, tabidxref, bytexref, errors = merged
+        for i, e in errors:
+            print("%5d: <%s>" % (i, e))
+
+        print("-- table-id stats --, %d * none, %d * empty" % (nr_recnone, nr_recempty))
+        for k, v in enumerate(tabidxref):
+            if v:
+                print("%5d * %02x" % (v, k))
+        if tabonly:
+            return
+        print("-- byte stats --")
+        for k, v in sorted(bytexref.items()):
+            if v:
+                print("%5d * %02x" % (v, k))
+
+
+def collect_recstats(dbfile, first, last, debug=False, tabonly=False):
+    """
+    Count deleted and empty records, table-ids and payload bytes for records `first` .. `last`.
+    With `tabonly` the payload bytes are not counted, and only the start of each record is read.
+
+    Returns a tuple: (nr_recnone, nr_recempty, tabidxref, bytexref, errors, leading, trailing, gaveup)
+    with `errors` a list of (recnum, message) for records which failed to decode,
+    `leading` and `trailing` the nr of consecutive errors at the start and end of the range.
+    Like `recdump`, this gives up after more than 5 consecutive errors, `gaveup` is then True.
+
+    Deleted records, and records pointing outside the .dat file are recognized from the
+    .tad index, only the remaining records are actually read.
+    Records pointing outside the .dat file count as errors.
+    """
+    nerr = 0
+    leading = None
+    gaveup = False
+    nr_recnone = 0
+    nr_recempty = 0
+    tabidxref = array("Q", bytes(256 * 8))
+    bytexref = Counter()
+    errors = []
+
+    recnums = range(first, min(last, dbfile.nrofrecords()) + 1)
+    for i in (recnums if tabonly else dbfile.prefetching(recnums)):
+        try:
+            state = dbfile.recstate(i)
+            if state == dbfile.DELETED:
+                nr_recnone += 1
+            elif state == dbfile.OUTSIDE:
+                raise Exception("record extends beyond the end of the .dat file")
+            else:
+                data = dbfile.readrecprefix(i) if tabonly else dbfile.readrec(i)
+                if not len(data):
+                    nr_recempty += 1
                 else:
-                    if data is None:
-                        nr_recnone += 1
-                    elif not len(data):
-                        nr_recempty += 1
-                    else:
-                        tabidxref[data[0]] += 1
-                        for b in data[1:]:
-                            bytexref[b] += 1
-                nerr = 0
-            except IndexError:
+                    tabidxref[data[0]] += 1
+                    if not tabonly:
+                        bytexref.update(data[1:])
+            if leading is None:
+                leading = nerr
+            nerr = 0
+        except Exception as e:
+            if debug:
+                raise
+            errors.append((i, str(e)))
+            nerr += 1
+            if nerr > 5:
+                gaveup = True
                 break
-            except Exception as e:
-                print("%5d: <%s>" % (i, e))
-                if args.debug:
-                    raise
-                nerr += 1
-                if nerr > 5:
-                    break
 
-        if args.stats:
-            print("-- table-id stats --, %d * none, %d * empty" % (nr_recnone, nr_recempty))
-            for k, v in enumerate(tabidxref):
-                if v:
-                    print("%5d * %02x" % (v, k))
-            print("-- byte stats --")
-            for k, v in enumerate(bytexref):
-                if v:
-                    print("%5d * %02x" % (v, k))
+    if leading is None:
+        # no record without errors
+        leading = nerr
+    return nr_recnone, nr_recempty, tabidxref, bytexref, errors, leading, nerr, gaveup
+
+
+def merge_recstats(ranges, results):
+    """
+    Combine the `collect_recstats` results for the consecutive record `ranges`
+    into (nr_recnone, nr_recempty, tabidxref, bytexref, errors).
+
+    The result is the same as for a single scan over all ranges: consecutive
+    errors are counted across range boundaries, and no results after the point where
+    that scan would have given up are used.
+    `results` is consumed lazily, and not beyond that point.
+    """
+    nr_recnone = 0
+    nr_recempty = 0
+    tabidxref = array("Q", bytes(256 * 8))
+    bytexref = Counter()
+    allerrors = []
+
+    nerr = 0
+    for (first, last), result in zip(ranges, results):
+        none, empty, tabs, counts, errors, leading, trailing, gaveup = result
+        if nerr + leading > 5:
+            # the scan gives up in the errors at the start of this range.
+            allerrors.extend(errors[:6 - nerr])
+            break
+
+        allerrors.extend(errors)
+        nr_recnone += none
+        nr_recempty += empty
+        for k, v in enumerate(tabs):
+            tabidxref[k] += v
+        bytexref.update(counts)
+        if gaveup:
+            break
+        if leading == last - first + 1:
+            # all records in this range failed
+            nerr += leading
+        else:
+            nerr = trailing
+
+    return nr_recnone, nr_recempty, tabidxref, bytexref, allerrors
+
+
+def shard_recstats(dbdir, name, first, last, debug, tabonly):
+    """
+    Worker process part of `Database.recstats`, opens its own
+    Cro<name> file handles and collects the stats for records `first` .. `last`.
+    """
+    dbfile = getattr(Database(dbdir), name.lower())
+    if tabonly:
+        return collect_recstats(dbfile, first, last, debug, tabonly)
+    with dbfile.sequential():
+        return collect_recstats(dbfile, first, last, debug, tabonly)
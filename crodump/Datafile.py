@@ -1,5 +1,9 @@
 import io
+import os
+import mmap
 import struct
+from array import array
+from contextlib import contextmanager
 import zlib
 
 from koddecoder import koddecode
@@ -8,6 +12,12 @@ from hexdump import tohex, toout
 class Datafile:
     """Represent a single .dat with it's .tad index file"""
 
+    # record states returned by `recstate`
+    DELETED, OUTSIDE, VALID = range(3)
+
+    # nr of records `prefetching` keeps loading ahead of a scan
+    PREFETCHRECS = 0x1000
+
     def __init__(self, name, dat, tad):
         self.name = name
         self.dat = dat
@@ -19,6 +29,124 @@ class Datafile:
         self.dat.seek(0, io.SEEK_END)
         self.datsize = self.dat.tell()
 
+        self.datmap = self.mapdat()
+
+    def mapdat(self):
+        """
+        Memory map the .dat file, so records can be sliced from the page cache
+        without a read call per record.
+        Returns None when the file can't be mapped, `readdata` then falls back to reading.
+        """
+        try:
+            return mmap.mmap(self.dat.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError, io.UnsupportedOperation):
+            # empty files, or file objects without a real file descriptor
+            return
+
+    def madvise(self, advice, start=0, length=None):
+        """
+        Tell the os how the .dat mapping is going to be accessed,
+        `advice` is the name of one of the mmap.MADV_* constants.
+        Without `start` and `length` the advice applies to the whole file.
+        This is ignored when the platform does not support it.
+        """
+        flag = getattr(mmap, advice, None)
+        if self.datmap is not None and flag is not None and hasattr(self.datmap, "madvise"):
+            if length is None:
+                length = len(self.datmap) - start
+            self.datmap.madvise(flag, start, length)
+
+    @contextmanager
+    def sequential(self):
+        """
+        Advise MADV_SEQUENTIAL on the .dat mapping for the duration of a
+        front to back scan, the default advice is restored afterwards.
+
+        usage:
+        with dbfile.sequential():
+            for ...
+        """
+        self.madvise("MADV_SEQUENTIAL")
+        try:
+            yield
+        finally:
+            self.madvise("MADV_NORMAL")
+
+    def fadvise(self, advice):
+        """
+        Tell the os how the .dat and .tad files are going to be read,
+        `advice` is the name of one of the os.POSIX_FADV_* constants.
+        This affects read calls on the file descriptors, not the .dat mapping.
+        This is ignored when the platform does not support it.
+        """
+        flag = getattr(os, advice, None)
+        if flag is None or not hasattr(os, "posix_fadvise"):
+            return
+        for fh in (self.dat, self.tad):
+            try:
+                os.posix_fadvise(fh.fileno(), 0, 0, flag)
+            except (OSError, io.UnsupportedOperation):
+                pass
+
+    def dropcache(self):
+        """
+        Drop the .dat and .tad files from the page cache.
+        The .dat mapping is closed first, since the os won't drop pages that are still mapped,
+        records are then read from the file.
+        """
+        if self.datmap is not None:
+            self.datmap.close()
+            self.datmap = None
+        self.fadvise("POSIX_FADV_DONTNEED")
+
+    def prefetch(self, first, last):
+        """
+        Ask the os to start loading the .dat bytes of records `first` .. `last`
+        into the page cache in the background, so a scan does not
+        wait on a page fault for each record.
+
+        Records are not always stored in recnum order, so each run of records which
+        are stored within a page of each other is advised separately, the gaps
+        between them are not loaded.
+        """
+        if self.datmap is None:
+            return
+        tadofs = self.tadofs[first - 1:last]
+        tadlen = self.tadlen[first - 1:last]
+        ranges = sorted((ofs, ofs + (ln & 0xFFFFFFF)) for ofs, ln in zip(tadofs, tadlen) if ln != 0xFFFFFFFF)
+
+        runstart = runend = None
+        for ofs, end in ranges:
+            if runend is not None and ofs <= runend + mmap.PAGESIZE:
+                runend = max(runend, end)
+                continue
+            if runend is not None:
+                self.adviserange(runstart, runend)
+            runstart, runend = ofs, end
+        if runend is not None:
+            self.adviserange(runstart, runend)
+
+    def adviserange(self, start, end):
+        """ MADV_WILLNEED the pages containing .dat bytes `start` .. `end` """
+        start &= ~(mmap.PAGESIZE - 1)
+        end = min(end, len(self.datmap))
+        if start < end:
+            self.madvise("MADV_WILLNEED", start, end - start)
+
+    def prefetching(self, recnums):
+        """
+        Yields the recnums from the sequence `recnums`, while keeping a `prefetch`
+        for the next PREFETCHRECS records running ahead of the scan.
+        """
+        n = self.PREFETCHRECS
+        for k in range(0, len(recnums), n):
+            if k == 0:
+                self.prefetch(recnums[0], recnums[min(n, len(recnums)) - 1])
+            ahead = recnums[k + n:k + 2 * n]
+            if ahead:
+                self.prefetch(ahead[0], ahead[-1])
+            yield from recnums[k:k + n]
+
     def readdathdr(self):
         """
         Read the .dat file header.
@@ -66,22 +194,50 @@ class Datafile:
         indexdata = self.tad.read()
         if self.use64bit:
             # 01.03 has 64 bit file offsets
-            self.tadidx = [ struct.unpack_from("<QLL", indexdata, 16 * _) for _ in range(len(indexdata) // 16) ]
-            if len(indexdata) % 16:
-                print("WARN: leftover data in .tad")
+            fmt, entrysize = "<QLL", 16
         else:
             # 01.02  and 01.04  have 32 bit offsets.
-            self.tadidx = [ struct.unpack_from("<LLL", indexdata, 12 * _) for _ in range(len(indexdata) // 12) ]
-            if len(indexdata) % 12:
-                print("WARN: leftover data in .tad")
+            fmt, entrysize = "<LLL", 12
+        if len(indexdata) % entrysize:
+            print("WARN: leftover data in .tad")
+
+        # the index is stored as separate offset, size and checksum arrays
+        n = len(indexdata) // entrysize
+        if n:
+            ofs, ln, chk = zip(*struct.iter_unpack(fmt, indexdata[:n * entrysize]))
+        else:
+            ofs = ln = chk = ()
+        self.tadofs = array("Q", ofs)
+        self.tadlen = array("I", ln)
+        self.tadchk = array("I", chk)
 
     def nrofrecords(self):
-        return len(self.tadidx)
+        return len(self.tadofs)
+
+    def tadentry(self, idx):
+        """
+        Returns the (offset, size, checksum) .tad entry for record `idx`.
+        """
+        return self.tadofs[idx - 1], self.tadlen[idx - 1], self.tadchk[idx - 1]
+
+    def recstate(self, idx):
+        """
+        Classify record `idx` by its .tad entry only, without reading the .dat.
+        Returns DELETED, OUTSIDE for records extending beyond the end of the .dat, or VALID.
+        """
+        ofs, ln, chk = self.tadentry(idx)
+        if ln == 0xFFFFFFFF:
+            return self.DELETED
+        if ofs + (ln & 0xFFFFFFF) > self.datsize:
+            return self.OUTSIDE
+        return self.VALID
 
     def readdata(self, ofs, size):
         """
         Read raw data from the .dat file
         """
+        if self.datmap is not None:
+            return self.datmap[ofs:ofs + size]
         self.dat.seek(ofs)
         return self.dat.read(size)
 
@@ -91,7 +247,7 @@ class Datafile:
         """
         if idx == 0:
             raise Exception("recnum must be a positive number")
-        ofs, ln, chk = self.tadidx[idx - 1]
+        ofs, ln, chk = self.tadentry(idx)
         if ln == 0xFFFFFFFF:
             # deleted record
             return
@@ -101,6 +257,68 @@ class Datafile:
         ln &= 0xFFFFFFF
         dat = self.readdata(ofs, ln)
 
+        return self.decoderec(idx, flags, dat)
+
+    def readrecprefix(self, idx):
+        """
+        Extract and decode only the first 4 bytes of a record, which start with the table-id.
+        Returns None for deleted records, and fewer bytes for short records.
+
+        Compressed records can't be decoded partially, when the prefix looks like
+        a compression header, the full record is decoded.
+        """
+        if idx == 0:
+            raise Exception("recnum must be a positive number")
+        ofs, ln, chk = self.tadentry(idx)
+        if ln == 0xFFFFFFFF:
+            # deleted record
+            return
+
+        flags = ln >> 24
+
+        ln &= 0xFFFFFFF
+        if ln and not flags:
+            dat = self.readdata(ofs, min(ln, 12))
+            extofs, extlen = struct.unpack("<LL", dat[:8])
+            encdat = dat[8:8 + extlen]
+            if len(encdat) < min(4, extlen):
+                # the prefix continues in the next block
+                return self.readrec(idx)[:4]
+        else:
+            encdat = self.readdata(ofs, min(ln, 4))
+
+        if self.encoding == 1:
+            encdat = koddecode(idx, encdat)
+        if encdat[2:4] in (b"\x08\x00", b"\x00\x08"):
+            return self.readrec(idx)[:4]
+
+        return encdat
+
+    def readrecs(self, ids):
+        """
+        Extract and decode several records, returns a dict: recnum -> data.
+        The records are read in .dat file order, so scattered lookups
+        become a single forward pass through the file.
+        """
+        ids = sorted(set(ids), key=lambda idx: self.tadofs[idx - 1])
+        return {idx: self.readrec(idx) for idx in ids}
+
+    def enumrecords(self, first=1, last=None):
+        """
+        Yields (recnum, data) for records `first` .. `last`, in recnum order.
+        Deleted records yield None for data.
+        """
+        if last is None:
+            last = self.nrofrecords()
+        with self.sequential():
+            for idx in range(first, last + 1):
+                yield idx, self.readrec(idx)
+
+    def decoderec(self, idx, flags, dat):
+        """
+        Decode the raw .dat bytes of record `idx`:
+        follow the extended record chain, KOD decode and decompress.
+        """
         if not dat:
             # empty record
             encdat = dat
@@ -148,70 +366,71 @@ class Datafile:
                 self.encoding, self.blocksize,
                 self.nrdeleted, self.firstdeleted))
 
-        ranges = []  # keep track of used bytes in the .dat file.
-
-        for i, (ofs, ln, chk) in enumerate(self.tadidx):
-            if ln == 0xFFFFFFFF:
-                print("%5d: %08x %08x %08x" % (i + 1, ofs, ln, chk))
-                continue
-            flags = ln >> 24
-
-            ln &= 0xFFFFFFF
-            dat = self.readdata(ofs, ln)
-            ranges.append((ofs, ofs + ln, "item #%d" % i))
-            decflags = [" ", " "]
-            infostr = ""
-            tail = b""
-
-            if not dat:
-                # empty record
-                encdat = dat
-            elif not flags:
-                if self.use64bit:
-                    extofs, extlen = struct.unpack("<QL", dat[:12])
-                    o = 12
-                else:
-                    extofs, extlen = struct.unpack("<LL", dat[:8])
-                    o = 8
-                infostr = "%08x;%08x" % (extofs, extlen)
-                encdat = dat[o:]
-                while len(encdat) < extlen:
-                    dat = self.readdata(extofs, self.blocksize)
-                    ranges.append((extofs, extofs + self.blocksize, "item #%d ext" % i))
+        with self.sequential():
+            ranges = []  # keep track of used bytes in the .dat file.
+
+            for i, (ofs, ln, chk) in enumerate(zip(self.tadofs, self.tadlen, self.tadchk)):
+                if ln == 0xFFFFFFFF:
+                    print("%5d: %08x %08x %08x" % (i + 1, ofs, ln, chk))
+                    continue
+                flags = ln >> 24
+
+                ln &= 0xFFFFFFF
+                dat = self.readdata(ofs, ln)
+                ranges.append((ofs, ofs + ln, "item #%d" % i))
+                decflags = [" ", " "]
+                infostr = ""
+                tail = b""
+
+                if not dat:
+                    # empty record
+                    encdat = dat
+                elif not flags:
                     if self.use64bit:
-                        (extofs,) = struct.unpack("<Q", dat[:8])
-                        o = 8
+                        extofs, extlen = struct.unpack("<QL", dat[:12])
+                        o = 12
                     else:
-                        (extofs,) = struct.unpack("<L", dat[:4])
-                        o = 4
-                    infostr += ";%08x" % (extofs)
-                    encdat += dat[o:]
-                tail = encdat[extlen:]
-                encdat = encdat[:extlen]
-                decflags[0] = "+"
-            else:
-                encdat = dat
-                decflags[0] = "*"
-
-            if self.encoding == 1:
-                decdat = koddecode(i + 1, encdat)
-            else:
-                decdat = encdat
-                decflags[0] = " "
-
-            if args.decompress and self.iscompressed(decdat):
-                decdat = self.decompress(decdat)
-                decflags[1] = "@"
-
-            print("%5d: %08x-%08x: (%02x:%08x) %s %s%s %s" % (
-                    i+1, ofs, ofs + ln, flags, chk,
-                    infostr, "".join(decflags), toout(args, decdat), tohex(tail)))
-
-        if args.verbose:
-            # output parts not referenced in the .tad file.
-            for o, l in self.enumunreferenced(ranges, self.datsize):
-                dat = self.readdata(o, l)
-                print("%08x-%08x: %s" % (o, o + l, toout(args, dat)))
+                        extofs, extlen = struct.unpack("<LL", dat[:8])
+                        o = 8
+                    infostr = "%08x;%08x" % (extofs, extlen)
+                    encdat = dat[o:]
+                    while len(encdat) < extlen:
+                        dat = self.readdata(extofs, self.blocksize)
+                        ranges.append((extofs, extofs + self.blocksize, "item #%d ext" % i))
+                        if self.use64bit:
+                            (extofs,) = struct.unpack("<Q", dat[:8])
+                            o = 8
+                        else:
+                            (extofs,) = struct.unpack("<L", dat[:4])
+                            o = 4
+                        infostr += ";%08x" % (extofs)
+                        encdat += dat[o:]
+                    tail = encdat[extlen:]
+                    encdat = encdat[:extlen]
+                    decflags[0] = "+"
+                else:
+                    encdat = dat
+                    decflags[0] = "*"
+
+                if self.encoding == 1:
+                    decdat = koddecode(i + 1, encdat)
+                else:
+                    decdat = encdat
+                    decflags[0] = " "
+
+                if args.decompress and self.iscompressed(decdat):
+                    decdat = self.decompress(decdat)
+                    decflags[1] = "@"
+
+                print("%5d: %08x-%08x: (%02x:%08x) %s %s%s %s" % (
+                        i+1, ofs, ofs + ln, flags, chk,
+                        infostr, "".join(decflags), toout(args, decdat), tohex(tail)))
+
+            if args.verbose:
+                # output parts not referenced in the .tad file.
+                for o, l in self.enumunreferenced(ranges, self.datsize):
+                    dat = self.readdata(o, l)
+                    print("%08x-%08x: %s" % (o, o + l, toout(args, dat)))
 
     def iscompressed(self, data):
         """
@@ -56,14 +56,30 @@ class Record:
         # the system number, in russian: Системный номер.
         self.fields = [ Field(tabledef[0], str(recno)) ]
 
-        rd = ByteReader(data)
-        for fielddef in tabledef[1:]:
-            if not rd.eof() and rd.testbyte(0x1b):
-                # read complex record indicated by b"\x1b"
-                rd.readbyte()
-                size = rd.readdword()
-                fielddata = rd.readbytes(size)
-            else:
-                fielddata = rd.readtoseperator(b"\x1e")
-
+        for fielddef, fielddata in zip(tabledef[1:], splitfields(data, len(tabledef) - 1)):
             self.fields.append(Field(fielddef, fielddata))
+
+
+def splitfields(data, nrfields):
+    """
+    Split record data in `nrfields` field values.
+    Fields are separated by b"\x1e", unless a field starts with b"\x1b", which
+    marks a complex field prefixed by its size.
+    Missing fields at the end of a record are returned as empty values.
+    """
+    if b"\x1b" not in data:
+        # no complex fields: a plain split.
+        values = data.split(b"\x1e", nrfields)[:nrfields]
+        return values + [b""] * (nrfields - len(values))
+
+    values = []
+    rd = ByteReader(data)
+    for _ in range(nrfields):
+        if not rd.eof() and rd.testbyte(0x1b):
+            # read complex record indicated by b"\x1b"
+            rd.readbyte()
+            size = rd.readdword()
+            values.append(rd.readbytes(size))
+        else:
+            values.append(rd.readtoseperator(b"\x1e"))
+    return values
@@ -133,6 +133,16 @@ def destruct(args):
         destruct_sys_definition(args, data)
 
 
+def positiveint(value):
+    """argparse type for options requiring a number >= 1"""
+    import argparse
+
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: %s" % value)
+    return n
+
+
 def main():
     import argparse
 
@@ -179,6 +189,9 @@ def main():
     p.add_argument("--inclencrypted", action="store_false", dest="skipencrypted", default="true",
                     help="include encrypted records in the output",)
     p.add_argument("--stats", action="store_true", help="calc table stats from the first byte of each record",)
+    p.add_argument("--tabstats", action="store_true", help="calc only the table stats, reading just the start of each record",)
+    p.add_argument("--jobs", "-j", type=positiveint, help="nr of processes for --stats, default: nr of cpus")
+    p.add_argument("--dropcache", action="store_true", help="drop the file from the os page cache when done, so a next run reads it from disk")
     p.add_argument("--index", action="store_true", help="dump CroIndex")
     p.add_argument("--stru", action="store_true", help="dump CroIndex")
     p.add_argument("--bank", action="store_true", help="dump CroBank")
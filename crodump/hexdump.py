@@ -19,7 +19,7 @@ def ashex(line):
     """
     convert a byte-array to a space separated list of 2-digit hex values.
     """
-    return " ".join("%02x" % _ for _ in line)
+    return b2a_hex(line, " ").decode("ascii")
 
 
 def aschr(b):
@@ -40,11 +40,15 @@ def aschr(b):
     return "."
 
 
+# maps all bytes which `aschr` would output as "." to a "."
+ASCTABLE = bytes(b if aschr(b) != "." else ord(".") for b in range(256))
+
+
 def asasc(line):
     """
     convert a CP-1251 encoded byte-array to a line of unicode characters.
     """
-    return "".join(aschr(_) for _ in line)
+    return bytes(line).translate(ASCTABLE).decode("cp1251")
 
 
 def hexdump(ofs, data, args):
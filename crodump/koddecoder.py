@@ -24,6 +24,10 @@ KOD = [
 ]
 INV = [0] * 256
 
+# KOD as a bytes.translate table, and the 0..255 shift sequence used by `koddecode`
+KODTABLE = bytes(KOD)
+RAMP = bytes(range(256))
+
 
 def calc_inverse():
     """
@@ -39,9 +43,19 @@ def koddecode(o, data):
     decode : shift, a[0]..a[n-1] -> b[0]..b[n-1]
 
         b[i] = KOD[a[i]]- (i+shift)
+
+    The KOD lookup is done with bytes.translate. The bytewise subtraction
+    of the (i+shift) sequence is done on the whole record at once, with
+    large integers: setting the top bit of each byte in `a` before subtracting,
+    and clearing it in `b`, prevents borrows between bytes. The correct
+    top bits are then restored with an xor.
     """
-    global KOD
-    return bytes((KOD[b] - i - o) % 256 for i, b in enumerate(data))
+    n = len(data)
+    o %= 256
+    a = int.from_bytes(data.translate(KODTABLE), "big")
+    b = int.from_bytes((RAMP * ((n + o) // 256 + 1))[o:o + n], "big")
+    h = int.from_bytes(b"\x80" * n, "big")
+    return (((a | h) - (b & ~h)) ^ ((a ^ ~b) & h)).to_bytes(n, "big")
 
 
 def kodencode(o, data):
@@ -1,5 +1,9 @@
 import struct
 
+WORD = struct.Struct("<H")
+DWORD = struct.Struct("<L")
+
+
 class ByteReader:
     """
     The ByteReader object is used when decoding various variable sized structures.
@@ -18,7 +22,7 @@ class ByteReader:
         if self.o + 1 > len(self.data):
             raise EOFError()
         self.o += 1
-        return struct.unpack_from("<B", self.data, self.o - 1)[0]
+        return self.data[self.o - 1]
 
     def testbyte(self, bytevalue):
         """
@@ -35,7 +39,7 @@ class ByteReader:
         if self.o + 2 > len(self.data):
             raise EOFError()
         self.o += 2
-        return struct.unpack_from("<H", self.data, self.o - 2)[0]
+        return WORD.unpack_from(self.data, self.o - 2)[0]
 
     def readdword(self):
         """
@@ -44,7 +48,7 @@ class ByteReader:
         if self.o + 4 > len(self.data):
             raise EOFError()
         self.o += 4
-        return struct.unpack_from("<L", self.data, self.o - 4)[0]
+        return DWORD.unpack_from(self.data, self.o - 4)[0]
 
     def readbytes(self, n=None):
         """